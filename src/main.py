@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+from concurrent.futures import ThreadPoolExecutor
 import json
+import logging
 import os
 from datetime import datetime
 from satellite_finder import satellite_db
@@ -15,8 +17,24 @@ class SatellitePassTrackerApp:
         self.root.title("Satellite Pass Tracker")
         self.config_data = self.load_config()
         self.sat_db = satellite_db()
+        # Searches run on a worker thread so the Tk event loop keeps running
+        self._executor = ThreadPoolExecutor(max_workers=1)
         self.create_widgets()
         self.last_results = []
+        self._closing = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        # Drop queued jobs and stop the search worker processes, a running job finishes on its own
+        self._closing = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.sat_db.close()
+        self.root.destroy()
+
+    def _after_worker(self, callback, future):
+        # Runs on the worker thread, hands the finished job back to the Tk thread unless the window is gone
+        if not self._closing:
+            self.root.after(0, callback, future)
 
     def create_widgets(self):
         def add_label_entry(row, label, default_value):
@@ -42,8 +60,10 @@ class SatellitePassTrackerApp:
         self.include_starlink.grid(row=8, column=1, padx=5, pady=5)
 
         # Search Button
-        ttk.Button(self.root, text="Search for Visible Passes", command=self.on_search).grid(row=9, column=0, columnspan=2, pady=10)
-        ttk.Button(self.root, text="Reload TLE", command=self.sat_db.reload_tle).grid(row=9, column=1, columnspan=2, pady=10)
+        self.search_button = ttk.Button(self.root, text="Search for Visible Passes", command=self.on_search)
+        self.search_button.grid(row=9, column=0, columnspan=2, pady=10)
+        self.reload_button = ttk.Button(self.root, text="Reload TLE", command=self.on_reload)
+        self.reload_button.grid(row=9, column=1, columnspan=2, pady=10)
 
         # Results Frame and Treeview
         self.results_frame = ttk.Frame(self.root)
@@ -115,19 +135,48 @@ class SatellitePassTrackerApp:
             if min_sma > max_sma:
                 raise ValueError("Minimum semimajor axis cannot be greater than the maximum.")
 
-            # Call the actual function to search for visible passes
-            results = self.search_visible_passes(
+            # Call the actual function to search for visible passes, off the Tk thread
+            self.search_button.config(state=tk.DISABLED)
+            self.reload_button.config(state=tk.DISABLED)
+            future = self._executor.submit(
+                self.search_visible_passes,
                 date, time, location, hours_window, min_altitude, min_sma, max_sma, include_starlink
             )
-            formated_results, self.last_results = results
-            # Clear previous results from the Treeview
-            for item in self.treeview.get_children():
-                self.treeview.delete(item)
+            future.add_done_callback(lambda f: self._after_worker(self._populate_results, f))
+
+        except ValueError as e:
+            messagebox.showerror("Input Error", str(e))
+
+    def on_reload(self):
+        # The reload goes through the same single worker as the searches, so it never runs during one
+        self.search_button.config(state=tk.DISABLED)
+        self.reload_button.config(state=tk.DISABLED)
+        future = self._executor.submit(self.sat_db.reload_tle)
+        future.add_done_callback(lambda f: self._after_worker(self._reload_done, f))
 
-            # Insert new results into the Treeview
+    def _reload_done(self, future):
+        self.search_button.config(state=tk.NORMAL)
+        self.reload_button.config(state=tk.NORMAL)
+        try:
+            future.result()
+        except Exception as e:
+            messagebox.showerror("Reload Error", str(e))
+
+    def _populate_results(self, future):
+        # Runs on the Tk thread once the search worker is done
+        self.search_button.config(state=tk.NORMAL)
+        self.reload_button.config(state=tk.NORMAL)
+        try:
+            formated_results, self.last_results = future.result()
+            # Clear previous results from the Treeview, in a single Tcl call
+            self.treeview.delete(*self.treeview.get_children())
+
+            # Insert new results into the Treeview, with no columns displayed so rows are not redrawn one by one
             if formated_results:
+                self.treeview.configure(displaycolumns=())
                 for result in formated_results:
                     self.treeview.insert("", tk.END, values=result)
+                self.treeview.configure(displaycolumns=self.columns)
                 # Update the total results label
                 self.total_results_label.config(text=f"Total Results: {len(formated_results)}")
             else:
@@ -154,23 +203,25 @@ class SatellitePassTrackerApp:
         )
 
 
-        formatted_results = []
-        i=0
-        for sat in results:
-            i=i+1
-            formatted_results.append((
-                i, 
+        def to_local(t):
+            return t.astimezone(local_tz).strftime("%H:%M:%S")
+
+        formatted_results = [
+            (
+                i,
                 sat[0].name,
-                sat[1].utc_datetime().astimezone(local_tz).strftime("%H:%M:%S"),
-                sat[2].utc_datetime().astimezone(local_tz).strftime("%H:%M:%S"),
-                sat[3].utc_datetime().astimezone(local_tz).strftime("%H:%M:%S"),
+                to_local(sat[1]),
+                to_local(sat[2]),
+                to_local(sat[3]),
                 sat[4],
                 sat[5],
-                f"{round(sat[6], 1)}°",
-                f"{round(sat[7])}s",
-                sat[8].astimezone(local_tz).strftime("%H:%M:%S"),
-                sat[9].astimezone(local_tz).strftime("%H:%M:%S")
-            ))
+                f"{sat[6]:.1f}°",
+                f"{sat[7]:.0f}s",
+                to_local(sat[8]),
+                to_local(sat[9]),
+            )
+            for i, sat in enumerate(results, start=1)
+        ]
 
         return formatted_results, results
 
@@ -222,6 +273,7 @@ class SatellitePassTrackerApp:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     root = tk.Tk()
     app = SatellitePassTrackerApp(root)
     root.mainloop()
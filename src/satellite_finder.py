@@ -1,202 +1,595 @@
-from skyfield.api import load, wgs84, utc, EarthSatellite
-from datetime import datetime, timedelta
+from skyfield.api import load, wgs84, EarthSatellite
+from skyfield.framelib import itrs
+from skyfield.toposlib import GeographicPosition
+from skyfield.constants import ERAD
+from skyfield.geometry import intersect_line_and_sphere
+from skyfield.sgp4lib import theta_GMST1982
+from sgp4.api import Satrec, SatrecArray, jday, accelerated
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from email.utils import formatdate
+import atexit
+import functools
+import itertools
+import json
+import logging
+import multiprocessing
+import numpy as np
 import pytz
 import requests
 import os
+import warnings
+
+log = logging.getLogger(__name__)
+
+# Propagation dominates the search, the pure Python fallback of sgp4 is many times slower
+if not accelerated:
+    warnings.warn("sgp4 C++ accelerator not available, satellite propagation will be much slower")
+
+# Sampling step (seconds) of the altitude grid used to screen for passes
+SCREEN_STEP_SECONDS = 10
+# Number of satellites propagated together, bounds the (sats, times, 3) buffers
+SCREEN_BATCH_SIZE = 500
+# Worker processes used to screen the batches, one per CPU
+SCREEN_WORKERS = os.cpu_count() or 1
+# Columns of the visible passes, times are TT Julian dates
+VISIBLE_PASS_DTYPE = [
+    ("start", "f8"),
+    ("peak", "f8"),
+    ("end", "f8"),
+    ("sun_start", "f8"),
+    ("sun_end", "f8"),
+    ("pass_idx", "i8"),
+    ("peak_alt", "f8"),
+    ("duration", "f8"),
+    ("start_dir", "U2"),
+    ("end_dir", "U2"),
+]
+# Earth's gravitational parameter (km^3/s^2) and equatorial radius (km), WGS84
+MU_EARTH = 398600.4418
+R_EARTH = 6378.137
+
+
+# Compass directions for each 45° sector, starting with North centred on 0°
+_DIRS = np.array(["N", "NE", "E", "SE", "S", "SW", "W", "NW"])
+
+
+def azimuths_to_directions(azimuths):
+    """
+    Converts azimuth angles to compass directions, for a single azimuth or an array of them.
+    Azimuth is expected in degrees, where 0° is North, 90° is East, 180° is South, and 270° is West.
+    """
+    return _DIRS[((np.asarray(azimuths) + 22.5) % 360 // 45).astype(np.int64)]
 
 
-def azimuth_to_direction(azimuth):
+def _find_pass_indices(alt, altitude_degrees):
     """
-    Converts an azimuth angle to a compass direction.
-    Azimuth is expected in degrees, where 0° is North, 90° is East, 180° is South, and 270° is West.
+    Finds the complete passes above altitude_degrees in a (satellites, times) altitude grid.
+    A pass already in progress at the first sample, or still in progress at the last one, is discarded.
+
+    Returns:
+        tuple: Index arrays with, for each pass, its row, the last sample before it rises,
+        the last sample before it sets and the sample where its altitude is highest.
+    """
+    above = alt >= altitude_degrees
+    # +1 where the satellite rises between samples k and k+1, -1 where it sets
+    edges = np.diff(above.astype(np.int8), axis=1)
+    rows, cols = np.nonzero(edges)
+    signs = edges[rows, cols]
+    # Rises and sets alternate along a row, so a rise followed by a set in the same row is a whole pass
+    first = np.flatnonzero((signs[:-1] == 1) & (signs[1:] == -1) & (rows[:-1] == rows[1:]))
+    rows, k_rise, k_set = rows[first], cols[first], cols[first + 1]
+
+    # Gather only the samples inside the passes, so memory follows the passes and not passes x window
+    lengths = k_set - k_rise
+    pass_starts = np.cumsum(lengths) - lengths
+    offsets = np.arange(lengths.sum()) - np.repeat(pass_starts, lengths)
+    values = alt.ravel()[np.repeat(rows * alt.shape[1] + k_rise + 1, lengths) + offsets]
+    if not len(values):
+        return rows, k_rise, k_set, k_rise
+    # The peak is the first sample of each pass equal to its maximum
+    peaks = np.maximum.reduceat(values, pass_starts)
+    hits = np.flatnonzero(values == np.repeat(peaks, lengths))
+    k_peak = k_rise + 1 + hits[np.searchsorted(hits, pass_starts)] - pass_starts
+    return rows, k_rise, k_set, k_peak
+
+
+def _screen_batch(satrecs, jd, fr, cos_theta, sin_theta, observer_xyz, up, sun):
+    """
+    Propagates a batch of satellites over the search grid with SatrecArray.
+
+    Returns:
+        tuple: The float32 topocentric altitude (degrees) and sunlit state of each satellite on
+        the grid, one row per satellite, and whether SGP4 returned an error for it.
+    """
+    e, r, _ = SatrecArray(satrecs).sgp4(jd, fr)
+    r = r.astype(np.float32)
+    gx = cos_theta * r[..., 0] + sin_theta * r[..., 1]
+    gy = -sin_theta * r[..., 0] + cos_theta * r[..., 1]
+    gz = r[..., 2]
+    x, y, z = gx - observer_xyz[0], gy - observer_xyz[1], gz - observer_xyz[2]
+    alt = np.degrees(np.arcsin((x * up[0] + y * up[1] + z * up[2]) / np.sqrt(x * x + y * y + z * z)))
+
+    # Cylindrical Earth shadow: sunlit if on the Sun's side of the Earth or outside the cylinder
+    along = gx * sun[0] + gy * sun[1] + gz * sun[2]
+    lit = (along > 0) | (gx * gx + gy * gy + gz * gz - along * along > R_EARTH**2)
+    return alt, lit, e.any(axis=1)
+
+
+def _screen_tle_batch(tle1, tle2, *grid):
+    """
+    _screen_batch for the worker processes. Satrec objects cannot be pickled, so the batch is
+    sent as TLE lines and parsed again in the worker.
     """
-    if azimuth >= 337.5 or azimuth < 22.5:
-        return "N"
-    elif azimuth >= 22.5 and azimuth < 67.5:
-        return "NE"
-    elif azimuth >= 67.5 and azimuth < 112.5:
-        return "E"
-    elif azimuth >= 112.5 and azimuth < 157.5:
-        return "SE"
-    elif azimuth >= 157.5 and azimuth < 202.5:
-        return "S"
-    elif azimuth >= 202.5 and azimuth < 247.5:
-        return "SW"
-    elif azimuth >= 247.5 and azimuth < 292.5:
-        return "W"
-    elif azimuth >= 292.5 and azimuth < 337.5:
-        return "NW"
+    return _screen_batch([Satrec.twoline2rv(l1, l2) for l1, l2 in zip(tle1, tle2)], *grid)
 
 
 class satellite_db:
+    # Timescale and ephemeris are loaded from disk once and shared by every instance
+    _ts = None
+    _eph = None
+
+    @classmethod
+    def _get_ts(cls):
+        if cls._ts is None:
+            cls._ts = load.timescale()
+        return cls._ts
+
+    @classmethod
+    def _get_eph(cls):
+        if cls._eph is None:
+            cls._eph = load("de421.bsp")
+        return cls._eph
+
     def __init__(self, tle_file_path="assets/satellite_tles.txt"):
 
         self.tle_file_path = tle_file_path
+        # One HTTP session for all TLE downloads, so reloads reuse the connection
+        self._http = requests.Session()
+        self._http.headers.update({"Accept-Encoding": "gzip", "User-Agent": "VisibleSatelliteFinder/1.0"})
         need_to_download_TLE = False
         # check if file exists in folder already. If not, try to download. If it is, check the date it was downloaded
         if not os.path.exists(self.tle_file_path):
-            print("File does not exist")
+            log.info("File does not exist")
             need_to_download_TLE = True
         else:
-            print("TLE file already exists")
-            file_date = os.path.getctime(self.tle_file_path)
-            print(f"File date: {datetime.fromtimestamp(file_date)}")
+            log.debug("TLE file already exists")
+            file_date = os.path.getmtime(self.tle_file_path)
+            log.debug("File date: %s", datetime.fromtimestamp(file_date))
             current_date = datetime.now().timestamp()
             if current_date - file_date > 86400:
-                print("TLE are stale (more than 1 day old). Downloading new file")
+                log.info("TLE are stale (more than 1 day old). Downloading new file")
                 need_to_download_TLE = True
             else:
-                print("TLE are fresh (less than 1 day old). Using local copy")
+                log.info("TLE are fresh (less than 1 day old). Using local copy")
 
         # check if it is needed to download the TLE, and try to download it. If it fails, use the local file and display a warning about using stale data.
-        self.satellite_tle_dict = {}
-
         if need_to_download_TLE:
-            print("Downloading TLE file")
+            log.info("Downloading TLE file")
             try:
                 self._fetch_and_save_tle_file()
             except Exception as e:
-                print(f"Error fetching TLE file: {e}")
-                print("Using local copy of TLE file, if available (WARNING: Data may be stale)")
-        self._process_tle_file()
-        self.satellites = load.tle_file(tle_file_path)
-        print(f"Loaded {len(self.satellites)} satellites")
-
-        self.eph = load("de421.bsp")
-        self.ts = load.timescale()
+                log.warning("Error fetching TLE file: %s", e)
+                log.warning("Using local copy of TLE file, if available (WARNING: Data may be stale)")
+        self.eph = satellite_db._get_eph()
+        self.ts = satellite_db._get_ts()
         self.sun = self.eph["sun"]
+        self._observer_cache = {}
+        self._pool = None
+        # Search results cached per set of arguments, kept on the instance so the cache
+        # goes away with it and reload_tle only clears this database's results
+        self._find_visible_satellites = functools.lru_cache(maxsize=16)(self._search)
+
+        self._process_tle_file()
+        self._index_satellites()
+        log.info("Loaded %d satellites", len(self.satellites))
 
     def reload_tle(self):
-        self.satellite_tle_dict = {}
-        print("Downloading TLE file")
+        log.info("Downloading TLE file")
         try:
             self._fetch_and_save_tle_file()
         except Exception as e:
-            print(f"Error fetching TLE file: {e}")
-            print("Using local copy of TLE file, if available (WARNING: Data may be stale)")
+            log.warning("Error fetching TLE file: %s", e)
+            log.warning("Using local copy of TLE file, if available (WARNING: Data may be stale)")
         self._process_tle_file()
-        self.satellites = load.tle_file(self.tle_file_path)
-        print(f"Loaded {len(self.satellites)} satellites")
-
+        self._index_satellites()
+        self._find_visible_satellites.cache_clear()
+        log.info("Loaded %d satellites", len(self.satellites))
 
+    def _index_satellites(self):
+        """
+        Precomputes per-satellite arrays used to filter self.satellites without propagating them.
+        The orbital elements are copied out of the Satrec models once, as arrays aligned with
+        self.satellites, so the filters are boolean masks instead of Python loops.
+        """
+        models = [s.model for s in self.satellites]
+        count = len(models)
+        self._no_kozai = np.fromiter((m.no_kozai for m in models), dtype=float, count=count)
+        self._ecco = np.fromiter((m.ecco for m in models), dtype=float, count=count)
+
+        # Semimajor axis (km) from the mean motion (rad/min) by Kepler's third law
+        mean_motion = self._no_kozai / 60.0
+        self._sma = (MU_EARTH / mean_motion**2) ** (1 / 3)
+        # Perigee and apogee heights (km), so eccentric orbits are kept if they cross the height band
+        self._perigee_height = self._sma * (1 - self._ecco) - R_EARTH
+        self._apogee_height = self._sma * (1 + self._ecco) - R_EARTH
+        # Starlink names all start with the constellation name, no need to search the whole string
+        self._is_starlink = np.char.startswith(self._names, "STARLINK")
+
+    def _get_observer(self, latitude, longitude):
+        """
+        Returns the wgs84 position for a latitude and longitude, reusing it across searches and graphs.
+        """
+        observer = self._observer_cache.get((latitude, longitude))
+        if observer is None:
+            observer = wgs84.latlon(latitude, longitude)
+            self._observer_cache[(latitude, longitude)] = observer
+        return observer
 
     def generate_azel_data(self, satellite, observer, t0, t1):
         """
         Generate azimuth and elevation data for a satellite between two times.
 
+        The samples are 10 seconds apart and are computed in a single vectorized call.
+
         Parameters:
-            satellite_name (str): The name of the satellite.
+            satellite (EarthSatellite): The satellite to track.
+            observer (tuple or GeographicPosition): Tuple of latitude and longitude in degrees
+                (lat, lon), or an observer position already built with wgs84.latlon.
             t0 (datetime): The start time as a timezone-aware datetime object.
             t1 (datetime): The end time as a timezone-aware datetime object.
 
         Returns:
             list: A list of tuples containing (time, azimuth, elevation) data points.
         """
-        # satellite = self.satellites[satellite_name]
-        observer = wgs84.latlon(observer[0], observer[1])
+        if not isinstance(observer, GeographicPosition):
+            observer = self._get_observer(observer[0], observer[1])
         difference = satellite - observer
+        # One Time array for the whole pass, end point included, so .at() computes precession/nutation once
+        total_seconds = (t1 - t0).total_seconds()
+        seconds = np.arange(0, total_seconds + 1e-9, 10.0)
+        # Offsets are added to the start in TT days, no calendar conversion per sample
         t_start = self.ts.utc(t0.year, t0.month, t0.day, t0.hour, t0.minute, t0.second)
-
-        # Calculate the end time (t1) by adding the timeframe in hours directly to the time
-        t_stop = self.ts.utc(
-            t1.year,
-            t1.month,
-            t1.day,
-            t1.hour,
-            t1.minute,
-            t1.second,
-        )
-        t_now = t_start
-        azel_data = []
-        while t_now < t_stop:
-            topocentric = difference.at(t_now)
-            alt, az, distance = topocentric.altaz()
-            azel_data.append((t_now.utc_iso(), az.degrees, alt.degrees))
-            t_now = t_now.utc_datetime() + timedelta(seconds=10)
-            t_now = self.ts.utc(
-                t_now.year,
-                t_now.month,
-                t_now.day,
-                t_now.hour,
-                t_now.minute,
-                t_now.second,
-            )
-        # topocentric = difference.at(t)
-        # alt, az, distance = topocentric.altaz()
+        times = t_start + seconds / 86400.0
+        alt, az, distance = difference.at(times).altaz()
+        azel_data = list(zip(times.utc_iso(), az.degrees.tolist(), alt.degrees.tolist()))
         return azel_data
 
     def _fetch_and_save_tle_file(self):
         """
         Fetches the TLE file from the internet and saves it locally.
+        The request is conditional on the local copy, so an unchanged file is not downloaded again.
         """
         try:
             url = "http://celestrak.org/NORAD/elements/gp.php?GROUP=active&FORMAT=tle"
-            response = requests.get(url)
-            # Save the fetched TLE file locally
-            if response.text.__contains__("<!DOCTYPE"):
-                raise Exception("Failed to fetch TLE file.")
-            with open(self.tle_file_path, "w") as f:
-                f.write(response.text)
-            print(f"TLE file downloaded and saved to {self.tle_file_path}")
-            # self._process_tle_file(response.text)
+            etag_file_path = self.tle_file_path + ".etag.json"
+            headers = {}
+            if os.path.exists(self.tle_file_path):
+                headers["If-Modified-Since"] = formatdate(os.path.getmtime(self.tle_file_path), usegmt=True)
+                if os.path.exists(etag_file_path):
+                    with open(etag_file_path, "r") as f:
+                        headers["If-None-Match"] = json.load(f)["etag"]
+            # The conditional headers are per request, on top of the session defaults. The body is
+            # streamed straight to disk instead of being held in memory
+            with self._http.get(url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 304:
+                    # Mark the local copy as checked, so it is not considered stale for another day
+                    os.utime(self.tle_file_path)
+                    log.info("TLE file not modified, keeping %s", self.tle_file_path)
+                    return
+                if response.status_code != 200:
+                    raise Exception("Failed to fetch TLE file.")
+                response.encoding = response.encoding or "utf-8"
+                # Drop empty lines here, so the file never needs rewriting when it is loaded
+                lines = (line for line in response.iter_lines(chunk_size=65536, decode_unicode=True) if line.strip())
+                # An error page instead of the TLE data shows up in its first line
+                first_line = next(lines, "")
+                if not first_line or "<!DOCTYPE" in first_line:
+                    raise Exception("Failed to fetch TLE file.")
+                # Save the fetched TLE file locally. The new file is written next to the old one and
+                # swapped in, so an interrupted download cannot corrupt it
+                tmp_file_path = self.tle_file_path + ".tmp"
+                try:
+                    with open(tmp_file_path, "w") as f:
+                        f.write(first_line + "\n")
+                        f.writelines(line + "\n" for line in lines)
+                    os.replace(tmp_file_path, self.tle_file_path)
+                finally:
+                    if os.path.exists(tmp_file_path):
+                        os.remove(tmp_file_path)
+                etag = response.headers.get("ETag")
+            if etag:
+                with open(etag_file_path, "w") as f:
+                    json.dump({"etag": etag}, f)
+            elif os.path.exists(etag_file_path):
+                os.remove(etag_file_path)
+            log.info("TLE file downloaded and saved to %s", self.tle_file_path)
         except Exception as e:
-            # print(f"Failed to fetch TLE file: {e}")
-            print("Failed to fetch TLE file, using local copy.")
+            log.debug("Failed to fetch TLE file: %s", e)
             raise Exception("Failed to fetch TLE file.")
 
-    def _load_local_tle_file(self):
+    def _process_tle_file(self):
         """
-        Loads the TLE file from a local file.
+        Processes the raw TLE data and populates the TLE arrays and the satellites list.
+        The file is read and parsed once, the satellites are built from the same lines.
+        A satellite is taken from a line starting with "1 " followed by one starting with
+        "2 ", the line before them is its name (the catalog number if it is missing), any
+        other line is skipped. The TLE lines are kept in parallel arrays indexed like
+        self.satellites, with self._name_to_idx mapping a satellite name to its row.
         """
         if not os.path.exists(self.tle_file_path):
             raise Exception(f"Local TLE file '{self.tle_file_path}' not found.")
 
+        # Single pass over the file, resyncing on the line 1 / line 2 prefixes
+        names, tle1s, tle2s, satellites = [], [], [], []
+        skipped = 0
+        name = tle_line_1 = None
         with open(self.tle_file_path, "r") as f:
-            tle_data = f.read()
-        print(f"Loaded TLE file from local file {self.tle_file_path}")
-        # self._process_tle_file(tle_data)
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("2 ") and tle_line_1 is not None:
+                    if name is None:
+                        name = tle_line_1[2:7].strip()
+                    names.append(name)
+                    tle1s.append(tle_line_1)
+                    tle2s.append(line)
+                    satellites.append(EarthSatellite(tle_line_1, line, name, self.ts))
+                    name = tle_line_1 = None
+                elif line.startswith("1 "):
+                    if tle_line_1 is not None:
+                        skipped += 1
+                    tle_line_1 = line
+                else:
+                    skipped += (name is not None) + (tle_line_1 is not None)
+                    name, tle_line_1 = line, None
+        skipped += (name is not None) + (tle_line_1 is not None)
+        if skipped:
+            log.warning("Skipped %d malformed lines in %s", skipped, self.tle_file_path)
+        self.satellites = satellites
+        self._names = np.asarray(names, dtype=str)
+        self._tle1 = np.asarray(tle1s, dtype=str)
+        self._tle2 = np.asarray(tle2s, dtype=str)
+        self._name_to_idx = {n: i for i, n in enumerate(names)}
 
-    def _process_tle_file(self):
+    def get_tle(self, satellite_name):
+        """
+        Retrieve the TLE string for a given satellite name.
+
+        Parameters:
+            satellite_name (str): The name of the satellite.
+
+        Returns:
+            tuple: The two TLE lines, or None if the satellite is not found.
         """
-        Processes the raw TLE data and populates the satellite_tle_dict.
+        i = self._name_to_idx.get(satellite_name)
+        return (str(self._tle1[i]), str(self._tle2[i])) if i is not None else None
+
+    def _find_sunlit_transition(self, satellite, t_lo, t_hi, lo_lit, tolerance_seconds=1.0):
         """
-        # open file and remove empty lines
-        with open(self.tle_file_path, "r") as file:
-            lines = file.readlines()
-            lines = [line for line in lines if line.strip()]
-        with open(self.tle_file_path, "w") as file:
-            file.writelines(lines)
+        Bisects for the moment the satellite crosses the edge of the Earth's shadow between two times.
 
-        if not os.path.exists(self.tle_file_path):
-            raise Exception(f"Local TLE file '{self.tle_file_path}' not found.")
+        Parameters:
+            satellite (EarthSatellite): The satellite.
+            t_lo, t_hi (Time): Times bracketing the crossing, on opposite sides of the shadow edge.
+            lo_lit (bool): Whether the satellite is sunlit at t_lo.
+            tolerance_seconds (float): Width of the final bracket.
 
-        with open(self.tle_file_path, "r") as f:
-            tle_data = f.read()
+        Returns:
+            Time: The end of the final bracket that is sunlit.
+        """
+        lo, hi = t_lo.tt, t_hi.tt
+        while (hi - lo) * 86400 > tolerance_seconds:
+            mid = (lo + hi) / 2
+            if satellite.at(self.ts.tt_jd(mid)).is_sunlit(self.eph) == lo_lit:
+                lo = mid
+            else:
+                hi = mid
+        return self.ts.tt_jd(lo if lo_lit else hi)
+
+    def _itrf_positions(self, satellites, t):
+        """
+        Propagates several satellites, each at its own times, and rotates the TEME positions
+        to ITRF with one GMST computation for all of them.
+
+        Parameters:
+            satellites (list): EarthSatellite objects, one per row of t.
+            t (Time): Times of shape (len(satellites),) or (len(satellites), n).
 
-        tle_data = tle_data.strip().split("\n")
+        Returns:
+            ndarray: ITRF positions in km, of shape (3,) + t.shape.
+        """
+        utc = t.utc
+        jd, fr = jday(utc.year, utc.month, utc.day, utc.hour, utc.minute, utc.second)
+        r = np.empty(t.shape + (3,))
+        for i, satellite in enumerate(satellites):
+            _, r[i], _ = satellite.model.sgp4_array(np.atleast_1d(jd[i]), np.atleast_1d(fr[i]))
+
+        theta, _ = theta_GMST1982(t.whole, t.ut1_fraction)
+        x = np.cos(theta) * r[..., 0] + np.sin(theta) * r[..., 1]
+        y = -np.sin(theta) * r[..., 0] + np.cos(theta) * r[..., 1]
+        return np.array([x, y, r[..., 2]])
+
+    def _topocentric_altaz(self, satellites, observer, t):
+        """
+        Computes the altitude and azimuth of several satellites, each at its own times, sharing
+        the TEME -> ITRF rotation instead of calling (satellite - observer).at() per satellite.
 
-        for i in range(0, len(tle_data) - 2, 3):
-            name = tle_data[i].strip()  # Satellite name (the first line)
-            tle_line_1 = tle_data[i + 1].strip()  # First TLE line (line 1)
-            tle_line_2 = tle_data[i + 2].strip()  # Second TLE line (line 2)
+        Parameters:
+            satellites (list): EarthSatellite objects, one per row of t.
+            observer (GeographicPosition): The observer's location.
+            t (Time): Times of shape (len(satellites), n).
 
-            # Store TLE lines as a tuple in the dictionary
-            tle_string = (tle_line_1, tle_line_2)
+        Returns:
+            tuple: Arrays of altitude and azimuth in degrees, with the shape of t.
+        """
+        x, y, z = self._itrf_positions(satellites, t)
+        ox, oy, oz = observer.itrs_xyz.km
+        x, y, z = x - ox, y - oy, z - oz
+
+        # Project on the observer's east, north and up directions
+        lat, lon = observer.latitude.radians, observer.longitude.radians
+        east = -np.sin(lon) * x + np.cos(lon) * y
+        north = -np.sin(lat) * np.cos(lon) * x - np.sin(lat) * np.sin(lon) * y + np.cos(lat) * z
+        up = np.cos(lat) * np.cos(lon) * x + np.cos(lat) * np.sin(lon) * y + np.sin(lat) * z
+        alt = np.degrees(np.arctan2(up, np.hypot(east, north)))
+        az = np.degrees(np.arctan2(east, north)) % 360.0
+        return alt, az
+
+    def _is_sunlit(self, satellites, t):
+        """
+        Whether each satellite is in sunlight at its time, like EarthSatellite.at(t).is_sunlit()
+        but with the Sun's position evaluated once for all the satellites.
 
-            # Add the satellite name and TLE string to the dictionary
-            self.satellite_tle_dict[name] = tle_string
+        Parameters:
+            satellites (list): EarthSatellite objects, one per element of t.
+            t (Time): Times of shape (len(satellites),).
 
-    def get_tle(self, satellite_name):
+        Returns:
+            ndarray: Boolean array, True where the satellite is sunlit.
         """
-        Retrieve the TLE string for a given satellite name.
+        position = self._itrf_positions(satellites, t)
+        sun = (self.sun - self.eph["earth"]).at(t).frame_xyz(itrs).km
+        # Same test as Skyfield: the line from the satellite towards the Sun must miss the Earth
+        near, far = intersect_line_and_sphere(sun - position, -position, ERAD / 1000.0)
+        return np.nan_to_num(far) <= 0
+
+    def _refine_crossings(self, satellites, observer, t0, s_lo, a_lo, a_hi, altitude_degrees, iterations=2):
+        """
+        Refines altitude threshold crossings bracketed by two grid samples, with a few false position
+        steps evaluated for all the satellites together.
 
         Parameters:
-            satellite_name (str): The name of the satellite.
+            satellites (list): EarthSatellite objects, one per crossing.
+            observer (GeographicPosition): The observer's location.
+            t0 (Time): Start of the grid.
+            s_lo (ndarray): Offset from t0 of the sample before each crossing, in seconds.
+            a_lo, a_hi (ndarray): Altitude above altitude_degrees at the two samples, of opposite signs.
+            altitude_degrees (float): The altitude threshold.
+            iterations (int): Number of false position steps.
+
+        Returns:
+            ndarray: Offset of each crossing from t0, in seconds.
+        """
+        s_lo = s_lo.astype(float)
+        s_hi = s_lo + SCREEN_STEP_SECONDS
+        a_lo, a_hi = a_lo.astype(float), a_hi.astype(float)
+        for _ in range(iterations):
+            s = s_lo + (s_hi - s_lo) * a_lo / (a_lo - a_hi)
+            a = self._topocentric_altaz(satellites, observer, t0 + s[:, None] / 86400.0)[0][:, 0] - altitude_degrees
+            # Keep the half of the bracket where the sign changes
+            low_side = np.sign(a) == np.sign(a_lo)
+            s_lo, a_lo = np.where(low_side, s, s_lo), np.where(low_side, a, a_lo)
+            s_hi, a_hi = np.where(low_side, s_hi, s), np.where(low_side, a_hi, a)
+        return s_lo + (s_hi - s_lo) * a_lo / (a_lo - a_hi)
+
+    def _get_pool(self):
+        """
+        Returns the process pool used to screen batches of satellites, started on first use.
+        Workers are spawned rather than forked, as the search runs on a thread of the Tk app.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=SCREEN_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            # Make sure the workers are stopped at exit, even if close() is never called
+            atexit.register(self._pool.shutdown)
+        return self._pool
+
+    def close(self):
+        """
+        Stops the screening worker processes, if they were started, and closes the HTTP session.
+        """
+        if self._pool is not None:
+            atexit.unregister(self._pool.shutdown)
+            self._pool.shutdown()
+            self._pool = None
+        self._http.close()
+
+    def _screen_passes(self, indices, observer, time, times, seconds, altitude_degrees):
+        """
+        Finds complete passes above altitude_degrees by propagating the satellites in batches
+        with SatrecArray over a shared time grid, instead of calling find_events per satellite.
+
+        Parameters:
+            indices (ndarray): Indices in self.satellites of the satellites to screen.
+            observer (GeographicPosition): The observer's location.
+            time (datetime): The observation start time (UTC).
+            times (Time): The shared search grid, starting at time.
+            seconds (ndarray): Offset of each grid point from time, in seconds.
+            altitude_degrees (float): Minimum altitude above the horizon for visibility.
 
         Returns:
-            str: A string containing the TLE lines, or None if the satellite is not found.
+            tuple: A list of (satellite, t_start, t_peak, t_end, lit) passes, where lit is the
+            satellite's sunlit state on the grid, and a list of the satellites SGP4 returned
+            an error for, to be handled with find_events.
         """
-        return self.satellite_tle_dict.get(satellite_name, None)
+        passes = []
+        fallback = []
+        if not len(indices):
+            return passes, fallback
+
+        jd, fr = jday(time.year, time.month, time.day, time.hour, time.minute, time.second)
+        jd = np.full(len(seconds), jd)
+        fr = fr + seconds / 86400.0
+
+        # The screening only needs km-level accuracy, so it runs in float32; the altitudes and
+        # azimuths reported for each pass are recomputed by Skyfield in float64 afterwards.
+        # TEME -> ITRF is a rotation about z by the GMST angle, computed once for the grid
+        theta, _ = theta_GMST1982(times.whole, times.ut1_fraction)
+        cos_theta, sin_theta = np.cos(theta).astype(np.float32), np.sin(theta).astype(np.float32)
+        observer_xyz = observer.itrs_xyz.km.astype(np.float32)
+        lat, lon = observer.latitude.radians, observer.longitude.radians
+        up = np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], dtype=np.float32)
+
+        # Direction of the Sun in ITRF, one ephemeris evaluation shared by all the satellites
+        sun = (self.sun - self.eph["earth"]).at(times).frame_xyz(itrs).km
+        sun = (sun / np.sqrt((sun * sun).sum(axis=0))).astype(np.float32)
+
+        # The propagation dominates the search, so with several CPUs the batches go to worker processes
+        batches = [indices[b:b + SCREEN_BATCH_SIZE] for b in range(0, len(indices), SCREEN_BATCH_SIZE)]
+        grid = (jd, fr, cos_theta, sin_theta, observer_xyz, up, sun)
+        if SCREEN_WORKERS > 1 and len(batches) > 1:
+            screened = self._get_pool().map(
+                _screen_tle_batch,
+                [self._tle1[batch] for batch in batches],
+                [self._tle2[batch] for batch in batches],
+                *(itertools.repeat(g) for g in grid),
+            )
+        else:
+            screened = (_screen_batch([self.satellites[i].model for i in batch], *grid) for batch in batches)
+
+        for batch, (alt, lit, failed) in zip(batches, screened):
+            batch = [self.satellites[i] for i in batch]
+            rows, k_rise, k_set, k_peak = _find_pass_indices(alt, altitude_degrees)
+            keep = ~failed[rows]
+            rows, k_rise, k_set, k_peak = rows[keep], k_rise[keep], k_set[keep], k_peak[keep]
+
+            # Rise and set are bracketed by the samples either side of the threshold, refined in float64
+            pass_sats = [batch[row] for row in rows]
+            rise_s = self._refine_crossings(
+                pass_sats, observer, times[0], seconds[k_rise],
+                alt[rows, k_rise] - altitude_degrees, alt[rows, k_rise + 1] - altitude_degrees, altitude_degrees
+            )
+            set_s = self._refine_crossings(
+                pass_sats, observer, times[0], seconds[k_set],
+                alt[rows, k_set] - altitude_degrees, alt[rows, k_set + 1] - altitude_degrees, altitude_degrees
+            )
+            # Vertex of the parabola through the samples around the maximum, within one step of k_peak
+            a0, a1, a2 = (alt[rows, k_peak + i].astype(float) for i in (-1, 0, 1))
+            curvature = a0 - 2 * a1 + a2
+            offset = np.where(curvature < 0, 0.5 * (a0 - a2) / np.where(curvature < 0, curvature, -1.0), 0.0)
+            peak_s = seconds[k_peak] + offset * SCREEN_STEP_SECONDS
+
+            t_rise = times[0] + rise_s / 86400.0
+            t_peak = times[0] + peak_s / 86400.0
+            t_set = times[0] + set_s / 86400.0
+            for i, row in enumerate(rows):
+                passes.append((batch[row], t_rise[i], t_peak[i], t_set[i], lit[row]))
+            fallback.extend(s for s, err in zip(batch, failed) if err)
+
+        return passes, fallback
 
     def find_visible_satellites(
         self,
@@ -222,17 +615,47 @@ class satellite_db:
             list: A list of visible satellites with name, event times, and states (in sunlight or shadow).
         """
         # Load the satellite TLE data and ephemeris
-        print("location", location)
-        print("time", time)
-        print("sma_range", sma_range)
-        print("altitude_degrees", altitude_degrees)
-        print("min_peak_altitude", min_peak_altitude)
-        print("timeframe_hours", timeframe_hours)
-        print("min_duration", min_duration)
-        print("include_starlink", include_starlink)
+        log.debug("location %s", location)
+        log.debug("time %s", time)
+        log.debug("sma_range %s", sma_range)
+        log.debug("altitude_degrees %s", altitude_degrees)
+        log.debug("min_peak_altitude %s", min_peak_altitude)
+        log.debug("timeframe_hours %s", timeframe_hours)
+        log.debug("min_duration %s", min_duration)
+        log.debug("include_starlink %s", include_starlink)
+
+        # Repeated searches with the same parameters are served from the cache, the key is
+        # made of hashable values and the time is truncated to the second as the search uses it
+        visible_satellites = self._find_visible_satellites(
+            (location[0], location[1]),
+            time.replace(microsecond=0),
+            (sma_range[0], sma_range[1]),
+            altitude_degrees,
+            min_peak_altitude,
+            timeframe_hours,
+            min_duration,
+            include_starlink,
+        )
+        log.debug("search complete")
+        return list(visible_satellites)
 
+    def _search(
+        self,
+        location,
+        time,
+        sma_range,
+        altitude_degrees,
+        min_peak_altitude,
+        timeframe_hours,
+        min_duration,
+        include_starlink,
+    ):
+        """
+        Runs the search for find_visible_satellites. Called through the per instance
+        cache self._find_visible_satellites, which is cleared by reload_tle.
+        """
         # Define the observer's location and time range
-        observer = wgs84.latlon(location[0], location[1])
+        observer = self._get_observer(location[0], location[1])
         # Get the start time (t0) from the input time
         t0 = self.ts.utc(
             time.year, time.month, time.day, time.hour, time.minute, time.second
@@ -248,110 +671,125 @@ class satellite_db:
             time.second,
         )
 
-        print(f"Searching for visible satellites from {t0.utc_iso()} to {t1.utc_iso()}")
-        visible_satellites = []
-        for satellite in self.satellites:
-            if not include_starlink and "STARLINK" in satellite.name:
-                continue
-            geocentric = satellite.at(t0)
-            height = wgs84.height_of(geocentric)
-            if height.km < sma_range[0] or height.km > sma_range[1]:
-                continue
+        log.debug("Searching for visible satellites from %s to %s", t0.utc_iso(), t1.utc_iso())
+        visible_rows = []
+        # Name filter first, then the orbit height, all before any propagation
+        candidate_mask = np.ones(len(self.satellites), dtype=bool) if include_starlink else ~self._is_starlink
+        candidate_mask &= (self._apogee_height >= sma_range[0]) & (self._perigee_height <= sma_range[1])
+        candidates = np.flatnonzero(candidate_mask)
+        # One Time array shared by every satellite, so precession/nutation is computed only once.
+        # It is built by adding TT day offsets to t0 rather than converting each UTC sample
+        steps = int(round((t1 - t0) * 86400 / SCREEN_STEP_SECONDS)) + 1
+        seconds = np.arange(steps) * SCREEN_STEP_SECONDS
+        times = t0 + seconds / 86400.0
+
+        passes, fallback = self._screen_passes(
+            candidates, observer, time, times, seconds, altitude_degrees
+        )
+
+        # Satellites that SGP4 could not propagate over the grid go through find_events instead
+        for satellite in fallback:
             t, events = satellite.find_events(observer, t0, t1, altitude_degrees)
-            # print(events)
-            if len(events) <= 3:
+            # A pass is a rise (0) and the next set (2), the culmination (1) follows the rise.
+            # If we catch a pass in the middle, it is discarded
+            rises = np.flatnonzero(events == 0)
+            sets = np.flatnonzero(events == 2)
+            k = np.searchsorted(sets, rises)
+            rises, sets = rises[k < len(sets)], sets[k[k < len(sets)]]
+            for i, j in zip(rises, sets):
+                passes.append((satellite, t[i], t[i + 1], t[j], None))
+
+        # Start, peak and end of every pass as a (passes, 3) array of TT dates, filtered by duration as a mask
+        pass_tt = np.array([[p[1].tt, p[2].tt, p[3].tt] for p in passes]).reshape(-1, 3)
+        keep = (pass_tt[:, 2] - pass_tt[:, 0]) * 24 * 3600 >= min_duration
+        passes = [p for p, k in zip(passes, keep) if k]
+        # Start, peak and end of every pass evaluated together, in a single (passes, 3) Time array
+        t_three = self.ts.tt_jd(pass_tt[keep])
+        alt, az = self._topocentric_altaz([p[0] for p in passes], observer, t_three)
+        keep = ~(alt[:, 1] < min_peak_altitude)
+        passes = [p for p, k in zip(passes, keep) if k]
+        alt, az = alt[keep], az[keep]
+        # Passes whose peak is in the Earth's shadow are dropped, with a single Sun ephemeris evaluation
+        keep = self._is_sunlit([p[0] for p in passes], self.ts.tt_jd(t_three.tt[keep, 1]))
+        passes = [p for p, k in zip(passes, keep) if k]
+        alt, az = alt[keep], az[keep]
+
+        # Compass directions of the start and end azimuths of every pass
+        directions = azimuths_to_directions(az[:, [0, 2]]).tolist()
+
+        for pass_idx, ((satellite, t_start, t_peak, t_end, lit), pass_alt, (start_dir, end_dir)) in enumerate(
+            zip(passes, alt, directions)
+        ):
+            peak_alt = pass_alt[1]
+            log.debug("searching for sunlit")
+            if lit is None:
+                # Sunlit state on the shared grid, the satellite's .at() reuses the cached rotations of times
+                lit = satellite.at(times).is_sunlit(self.eph)
+            k_first = int(np.ceil((t_start - t0) * 86400 / SCREEN_STEP_SECONDS))
+            k_last = min(int((t_end - t0) * 86400 // SCREEN_STEP_SECONDS), len(lit) - 1)
+            lit_samples = np.flatnonzero(lit[k_first:k_last + 1])
+            if not lit_samples.size:
                 continue
-            else:
-                i = 0
-                #search for a rise event. If we catch a pass in the middle, it is discarded
-                while events[i] != 0:
-                    i += 1
-                while i + 2 < len(events - 1):
-
-                    t_peak = t[i + 1]
-                    duration = t[i + 2] - t[i + 0]
-                    t_start = t[i + 0]
-                    t_end = t[i + 2]
-                    # print(duration*24*3600)
-                    i += 3
-                    if duration * 24 * 3600 < min_duration:
-                        continue
-                    difference = satellite - observer
-                    topocentric = difference.at(t_peak)
-                    peak_alt, az, d = topocentric.altaz()
-                    # print(peak_alt.degrees)
-                    if peak_alt.degrees < min_peak_altitude:
-                        continue
-                    _, start_az, _ = difference.at(t_start).altaz()
-                    _, end_az, _ = difference.at(t_end).altaz()
-                    sunlit = False
-                    t_sun_start = t_start
-                    t_sun_end = t_end
-                    print("searching for sunlit")
-                    while satellite.at(t_sun_start).is_sunlit(self.eph) != True and t_sun_start.tt < t_end.tt:
-                        t_sun_start = t_sun_start.utc_datetime() + timedelta(seconds=10)
-                        t_sun_start = self.ts.utc(
-                            t_sun_start.year,
-                            t_sun_start.month,
-                            t_sun_start.day,
-                            t_sun_start.hour,
-                            t_sun_start.minute,
-                            t_sun_start.second,
-                        )
-                    
-                    # print(t_sun_start, satellite.at(t_sun_start).is_sunlit(self.eph))
-                    if t_sun_start.tt >= t_end.tt:
-                        continue
-
-                    while satellite.at(t_sun_end).is_sunlit(self.eph) != True and t_sun_end.tt > t_start.tt:
-                        t_sun_end = t_sun_end.utc_datetime() - timedelta(seconds=10)
-                        t_sun_end = self.ts.utc(
-                            t_sun_end.year,
-                            t_sun_end.month,
-                            t_sun_end.day,
-                            t_sun_end.hour,
-                            t_sun_end.minute,
-                            t_sun_end.second,
-                        )
-
-
-                    # print(t_sun_start, satellite.at(t_sun_start).is_sunlit(self.eph))
-                    
-                    if t_sun_end.tt <= t_start.tt:
-                        continue
-                    
-                    duration = (t_sun_end - t_sun_start)*3600*24
-                    # print(duration)
-                    if(duration < min_duration):
-                        continue
-                    sunlit = True
-
-                    sunlit = satellite.at(t_peak).is_sunlit(self.eph)
-                    # print(sunlit)
-                    if sunlit:
-                        visible_satellites.append(
-                            [
-                                satellite,
-                                t_start,
-                                t_peak,
-                                t_end,
-                                azimuth_to_direction(start_az.degrees),
-                                azimuth_to_direction(end_az.degrees),
-                                peak_alt.degrees,
-                                duration,
-                                t_sun_start,
-                                t_sun_end
-                            ]
-                        )
-
-            # Sort the visible satellites by the start time (t_start) in position [1]
-        visible_satellites.sort(key=lambda x: x[1])
-        print("search complete")
+
+            # Shadow crossings are bracketed by the grid, bisect between the two samples around them
+            k_sun_start = k_first + lit_samples[0]
+            k_sun_end = k_first + lit_samples[-1]
+            t_sun_start = t_start
+            if k_sun_start > 0 and not lit[k_sun_start - 1]:
+                t_cross = self._find_sunlit_transition(satellite, times[k_sun_start - 1], times[k_sun_start], False)
+                if t_cross.tt > t_start.tt:
+                    t_sun_start = t_cross
+            t_sun_end = t_end
+            if k_sun_end < len(lit) - 1 and not lit[k_sun_end + 1]:
+                t_cross = self._find_sunlit_transition(satellite, times[k_sun_end], times[k_sun_end + 1], True)
+                if t_cross.tt < t_end.tt:
+                    t_sun_end = t_cross
+
+            duration = (t_sun_end - t_sun_start)*3600*24
+            if(duration < min_duration):
+                continue
+            visible_rows.append(
+                (
+                    t_start.tt,
+                    t_peak.tt,
+                    t_end.tt,
+                    t_sun_start.tt,
+                    t_sun_end.tt,
+                    pass_idx,
+                    peak_alt,
+                    duration,
+                    start_dir,
+                    end_dir,
+                )
+            )
+
+        # Sort the visible passes by their start time on a record array, then build the Time objects
+        records = np.array(visible_rows, dtype=VISIBLE_PASS_DTYPE)
+        records = records[np.argsort(records["start"], kind="stable")]
+        t_start, t_peak, t_end, t_sun_start, t_sun_end = (
+            self.ts.tt_jd(records[name]) for name in ("start", "peak", "end", "sun_start", "sun_end")
+        )
+        visible_satellites = [
+            [
+                passes[record["pass_idx"]][0],
+                t_start[i],
+                t_peak[i],
+                t_end[i],
+                str(record["start_dir"]),
+                str(record["end_dir"]),
+                float(record["peak_alt"]),
+                float(record["duration"]),
+                t_sun_start[i],
+                t_sun_end[i],
+            ]
+            for i, record in enumerate(records)
+        ]
         return visible_satellites
 
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     location = (38.045887, 23.864028)
     # Ensure the datetime is timezone-aware and set to UTC
     # time = datetime.now()